@@ -1,6 +1,32 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+SERVERS = ("gunicorn", "uwsgi", "daphne", "uvicorn")
+
+
+def _is_server_process():
+    # check/migrate/test/shell o scripts sueltos no deben lanzar hilos que le pegan a ML
+    argv0 = sys.argv[0] if sys.argv else ""
+    if any(server in argv0 for server in SERVERS):
+        return True
+    if os.path.basename(argv0) == "manage.py" and sys.argv[1:2] == ["runserver"]:
+        # solo el proceso hijo del autoreloader (o con --noreload)
+        return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
+    return False
 
 
 class GpointConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Gpoint'
+
+    def ready(self):
+        # el prober parte con el proceso, no con el primer /ml/health/.
+        # Con gunicorn --preload el hilo no sobrevive al fork: las vistas de
+        # health lo vuelven a lanzar en cada worker si hace falta.
+        if getattr(settings, "ML_HEALTH_AUTOSTART", True) and _is_server_process():
+            from .services import health
+            health.start_prober()
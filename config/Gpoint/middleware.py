@@ -0,0 +1,152 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+
+from .services.shared_cache import Lease, lease_key
+
+# Control de admisión para las vistas que le pegan a MercadoLibre.
+# Cada vista limitada tiene un máximo de requests en vuelo y una cola corta;
+# lo que no entra se descarta rápido: respuesta stale si la tenemos, si no 503.
+# Las vistas que no están en la config (home, eco_tips, ...) pasan directo.
+#
+# Los límites son por host: cada cupo es un Lease en el cache compartido
+# (ver services/shared_cache.py), así funcionan igual con workers sync de
+# gunicorn (un request por proceso) que con workers con hilos. El lease se
+# renueva mientras dura el request y solo lo suelta el request que lo tomó.
+
+DEFAULT_LIMITS = {
+    "productos": {"max_concurrent": 4, "max_queue": 8, "max_wait": 2.0},
+    "ml_search_api": {"max_concurrent": 4, "max_queue": 8, "max_wait": 2.0},
+}
+LIMITS = getattr(settings, "ML_ADMISSION_LIMITS", DEFAULT_LIMITS)
+RETRY_AFTER = getattr(settings, "ML_ADMISSION_RETRY_AFTER", 5)     # segundos
+STALE_TTL = getattr(settings, "ML_ADMISSION_STALE_TTL", 3600)      # cuánto guardamos la última respuesta buena
+# lease de un cupo: se renueva mientras el request sigue; solo vence si el worker murió
+SLOT_TTL = getattr(settings, "ML_ADMISSION_SLOT_TTL", 30)
+POLL = 0.05                                                         # segundos entre intentos en la cola
+
+
+class _Limiter:
+    def __init__(self, name, max_concurrent, max_queue, max_wait):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._slots = [f"admission:{name}:slot:{i}" for i in range(max_concurrent)]
+        self._queue = [f"admission:{name}:queue:{i}" for i in range(max_queue)]
+
+    def _take(self, names):
+        for name in names:
+            lease = Lease(name, SLOT_TTL)
+            if lease.acquire():
+                return lease
+        return None
+
+    def _count(self, what):
+        key = f"admission:{self.name}:{what}"
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+    def acquire(self):
+        """Devuelve el Lease del cupo tomado, o None si el request se descarta."""
+        slot = self._take(self._slots)
+        if slot is None:
+            ticket = self._take(self._queue)
+            if ticket is None:
+                self._count("shed")
+                return None
+            try:
+                deadline = time.monotonic() + self.max_wait
+                while slot is None and time.monotonic() < deadline:
+                    time.sleep(POLL)
+                    slot = self._take(self._slots)
+            finally:
+                ticket.release()
+            if slot is None:
+                self._count("shed")
+                return None
+        self._count("admitted")
+        return slot
+
+    def release(self, slot):
+        slot.release()
+
+    def mark_stale(self):
+        self._count("served_stale")
+
+    def stats(self):
+        counters = [f"admission:{self.name}:{what}" for what in ("admitted", "shed", "served_stale")]
+        slots = [lease_key(name) for name in self._slots]
+        queue = [lease_key(name) for name in self._queue]
+        live = cache.get_many(slots + queue + counters)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": sum(1 for key in slots if key in live),
+            "queue_depth": sum(1 for key in queue if key in live),
+            "admitted": live.get(counters[0], 0),
+            "shed": live.get(counters[1], 0),
+            "served_stale": live.get(counters[2], 0),
+        }
+
+
+_limiters = {name: _Limiter(name, **conf) for name, conf in LIMITS.items()}
+
+
+def stats():
+    """Estado de cada vista limitada (compartido por todos los workers del host)."""
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+def _stale_key(request):
+    # hash para no pasarnos del largo de key con queries largas
+    path = request.get_full_path().encode("utf-8")
+    return "admission:stale:" + hashlib.sha1(path).hexdigest()
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            url_name = None
+        limiter = _limiters.get(url_name)
+        if limiter is None:
+            return self.get_response(request)
+
+        slot = limiter.acquire()
+        if slot is None:
+            return self._shed(request, limiter)
+        with slot:  # se renueva si el request se alarga
+            response = self.get_response(request)
+
+        # solo guardamos como stale lo que la vista marcó como resultado bueno
+        # (productos renderiza 200 aunque ML haya fallado)
+        if request.method == "GET" and getattr(response, "admission_stale_ok", False):
+            cache.set(
+                _stale_key(request),
+                (response.content, response.get("Content-Type")),
+                STALE_TTL,
+            )
+        return response
+
+    def _shed(self, request, limiter):
+        if request.method == "GET":
+            stale = cache.get(_stale_key(request))
+            if stale is not None:
+                content, content_type = stale
+                limiter.mark_stale()
+                response = HttpResponse(content, content_type=content_type)
+                response["X-Admission"] = "stale"
+                return response
+        response = JsonResponse({"ok": False, "error": "Servidor saturado, intenta de nuevo."}, status=503)
+        response["Retry-After"] = str(RETRY_AFTER)
+        response["X-Admission"] = "shed"
+        return response
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from . import mercadolibre as ml_service
+
+# Prober en segundo plano para /ml/health/.
+# Las vistas NO llaman a MercadoLibre: solo leen el último snapshot en memoria.
+
+PROBE_INTERVAL = getattr(settings, "ML_HEALTH_INTERVAL", 30)       # segundos entre rondas
+STALE_AFTER = getattr(settings, "ML_HEALTH_STALE_AFTER", PROBE_INTERVAL * 3)
+WINDOW = getattr(settings, "ML_HEALTH_WINDOW", 20)                 # muestras por check
+CANARY_QUERY = getattr(settings, "ML_HEALTH_CANARY_QUERY", "botella")
+# más de 1 para que el filtro ecológico no deje el canario vacío por sí solo
+CANARY_LIMIT = getattr(settings, "ML_HEALTH_CANARY_LIMIT", 4)
+
+CHECKS = ("token", "users_me", "canary_search")
+
+_lock = threading.Lock()
+_thread = None
+_samples = {name: deque(maxlen=WINDOW) for name in CHECKS}
+_state = {
+    "started_at": None,
+    "last_run": None,
+    "user_id": None,
+    "site_id": None,
+    "canary_results": None,
+    "last_error": {name: None for name in CHECKS},
+}
+
+
+# ===================== CHECKS =====================
+
+def _check_token():
+    ml_service._get_access_token()
+
+
+def _check_users_me():
+    me = ml_service.get_me()
+    with _lock:
+        _state["user_id"] = me.get("id")
+        _state["site_id"] = me.get("site_id")
+
+
+def _check_canary_search():
+    results, _paging = ml_service.buscar_items_por_categoria(CANARY_QUERY, limit=CANARY_LIMIT)
+    with _lock:
+        _state["canary_results"] = len(results)
+    # buscar_items_por_categoria traga los errores HTTP y devuelve []:
+    # para el canario, vacío es falla
+    if not results:
+        raise RuntimeError(f"canary search '{CANARY_QUERY}' returned no results")
+
+
+_CHECK_FUNCS = {
+    "token": _check_token,
+    "users_me": _check_users_me,
+    "canary_search": _check_canary_search,
+}
+
+
+def _timed(name):
+    t0 = time.perf_counter()
+    error = None
+    try:
+        _CHECK_FUNCS[name]()
+    except Exception as e:
+        error = str(e)
+    latency_ms = (time.perf_counter() - t0) * 1000
+    with _lock:
+        _samples[name].append((error is None, latency_ms))
+        _state["last_error"][name] = error
+    return error is None
+
+
+def run_probe():
+    """Ejecuta una ronda completa de checks y actualiza el snapshot."""
+    # si el token falla no tiene sentido pegarle al resto
+    if _timed("token"):
+        _timed("users_me")
+        _timed("canary_search")
+    with _lock:
+        _state["last_run"] = time.time()
+
+
+def _loop():
+    while True:
+        run_probe()
+        time.sleep(PROBE_INTERVAL)
+
+
+def start_prober():
+    """Lanza el hilo del prober una sola vez por proceso."""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _state["started_at"] = time.time()
+        _thread = threading.Thread(target=_loop, name="ml-health-prober", daemon=True)
+        _thread.start()
+
+
+def is_alive():
+    return _thread is not None and _thread.is_alive()
+
+
+# ===================== SNAPSHOT =====================
+
+def _stats(samples):
+    if not samples:
+        return {"samples": 0, "ok": None, "error_rate": None, "p50_ms": None, "p95_ms": None}
+    latencies = sorted(lat for _ok, lat in samples)
+    errors = sum(1 for ok, _lat in samples if not ok)
+    n = len(latencies)
+    return {
+        "samples": n,
+        "ok": samples[-1][0],
+        "error_rate": round(errors / n, 3),
+        "p50_ms": round(latencies[n // 2], 1),
+        "p95_ms": round(latencies[min(n - 1, int(n * 0.95))], 1),
+    }
+
+
+def snapshot():
+    """Estado actual en memoria, sin tocar la red."""
+    with _lock:
+        checks = {name: _stats(list(_samples[name])) for name in CHECKS}
+        for name in CHECKS:
+            checks[name]["last_error"] = _state["last_error"][name]
+        last_run = _state["last_run"]
+        data = {
+            "user_id": _state["user_id"],
+            "site_id": _state["site_id"],
+            "canary_results": _state["canary_results"],
+        }
+    age = None if last_run is None else round(time.time() - last_run, 1)
+    stale = age is None or age > STALE_AFTER
+    ok = not stale and all(checks[name]["ok"] for name in CHECKS)
+    if ok:
+        status = "ok"
+    elif last_run is None and is_alive():
+        status = "starting"   # el prober todavía no termina su primera ronda
+    elif stale:
+        status = "stale"
+    else:
+        status = "failing"
+    return {
+        "ok": ok,
+        "status": status,
+        "stale": stale,
+        "age_s": age,
+        "prober_alive": is_alive(),
+        "checks": checks,
+        **data,
+    }
@@ -1,8 +1,11 @@
 import os
+import threading
 import time
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from . import token_store as ts
+from .shared_cache import Lease
 from dotenv import load_dotenv
 from urllib.parse import quote
 
@@ -26,6 +29,19 @@ MIN_HEADERS = {
     "Accept": "application/json",
 }
 
+SEARCH_CACHE_TTL = getattr(settings, "ML_SEARCH_CACHE_TTL", 600)
+# los resultados vacíos suelen ser fallas tragadas, no los guardamos tanto
+SEARCH_EMPTY_TTL = getattr(settings, "ML_SEARCH_EMPTY_TTL", 60)
+# lease del lock de una búsqueda; se renueva mientras el fetch sigue corriendo
+FETCH_LOCK_TTL = getattr(settings, "ML_FETCH_LOCK_TTL", 30)
+# cuánto espera un request a que otro worker termine la misma búsqueda; después falla
+FETCH_WAIT_TIMEOUT = getattr(settings, "ML_FETCH_WAIT_TIMEOUT", 30)
+# si ese fetch falla, los que esperaban fallan también durante este rato
+FETCH_ERROR_TTL = getattr(settings, "ML_FETCH_ERROR_TTL", 5)
+
+# contador de llamadas HTTP a ML por hilo (lo usa el prewarm para su presupuesto)
+_calls = threading.local()
+
 
 # ===================== TOKENS =====================
 
@@ -37,6 +53,25 @@ def _get_refresh_token():
 
 
 def _refresh_access_token():
+    # un solo refresh por host: si otro worker ya está en eso, usamos su token
+    previous = ts.get_cached_access_token()
+    for _attempt in range(2):
+        lease = ts.acquire_refresh_lock()
+        if lease is not None:
+            with lease:
+                # otro worker pudo refrescar justo antes de que tomáramos el lock
+                token = ts.get_cached_access_token()
+                if token and token != previous:
+                    return token
+                return _do_refresh()
+        token = ts.wait_for_access_token(previous)
+        if token:
+            return token
+        # el otro worker falló o murió: probamos tomar el lock nosotros
+    raise RuntimeError("token refresh did not complete in another worker")
+
+
+def _do_refresh():
     url = f"{BASE_URL}/oauth/token"
     data = {
         "grant_type": "refresh_token",
@@ -44,6 +79,7 @@ def _refresh_access_token():
         "client_secret": CLIENT_SECRET,
         "refresh_token": _get_refresh_token(),
     }
+    _calls.n = upstream_calls() + 1
     r = requests.post(url, data=data, timeout=15)
     r.raise_for_status()
     tok = r.json()
@@ -69,13 +105,23 @@ def _auth_headers():
 
 # ===================== HELPERS HTTP =====================
 
+def upstream_calls():
+    """Cantidad de requests a ML hechos por el hilo actual."""
+    return getattr(_calls, "n", 0)
+
+
+def _http_get(url, **kwargs):
+    _calls.n = upstream_calls() + 1
+    return requests.get(url, **kwargs)
+
+
 def ml_get(path, params=None, need_auth=False, retries=1):
     url = f"{BASE_URL}{path}"
     last_err = None
     for attempt in range(retries + 1):
         try:
             headers = _auth_headers() if need_auth else MIN_HEADERS
-            r = requests.get(url, headers=headers, params=params, timeout=12)
+            r = _http_get(url, headers=headers, params=params, timeout=12)
             # si token venció, refrescamos una vez
             if r.status_code in (401, 403) and need_auth and attempt < retries:
                 _refresh_access_token()
@@ -235,7 +281,7 @@ def buscar_items_por_categoria(query: str, site_id: str = "MLC", limit: int =12,
 
     # 1) descubrir categoría desde el texto del usuario
     try:
-        dd = requests.get(
+        dd = _http_get(
             f"{BASE_URL}/sites/{site_id}/domain_discovery/search",
             params={"q": query},
             headers=headers,
@@ -253,7 +299,7 @@ def buscar_items_por_categoria(query: str, site_id: str = "MLC", limit: int =12,
         return [], _paging_empty(site_id, query, limit, offset)
 
     # 2) pedir los destacados de esa categoría
-    hi = requests.get(
+    hi = _http_get(
         f"{BASE_URL}/highlights/{site_id}/category/{category_id}",
         headers=headers,
         timeout=10,
@@ -279,7 +325,7 @@ def buscar_items_por_categoria(query: str, site_id: str = "MLC", limit: int =12,
 
     for pid in slice_ids:
         # 3a) detalle del producto de catálogo
-        rp = requests.get(
+        rp = _http_get(
             f"{BASE_URL}/products/{pid}",
             headers=headers,
             timeout=10,
@@ -296,7 +342,7 @@ def buscar_items_por_categoria(query: str, site_id: str = "MLC", limit: int =12,
             img = pictures[0].get("secure_url") or pictures[0].get("url")
 
         # 3b) ver si hay items reales para este producto
-        ritems = requests.get(
+        ritems = _http_get(
             f"{BASE_URL}/products/{pid}/items",
             params={"site_id": site_id},
             headers=headers,
@@ -350,6 +396,7 @@ def buscar_items_por_categoria(query: str, site_id: str = "MLC", limit: int =12,
         "site_used": site_id,
         "fallback": False,
         "used_query": query,
+        "category_name": ddj[0].get("category_name"),
     }
     return items_out, paging
 
@@ -363,3 +410,67 @@ def _paging_empty(site_id, query, limit, offset):
         "fallback": False,
         "used_query": query,
     }
+
+
+# ===================== CACHE DE RESULTADOS =====================
+
+def _cache_key(kind, query, site_id, limit, offset):
+    return f"ml:{kind}:{site_id}:{limit}:{offset}:{quote(query.strip().lower())}"
+
+
+def _wait_for_entry(key, lock_key, deadline):
+    while time.time() < deadline:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+        if cache.get(lock_key) is None:
+            # el dueño del lock terminó sin dejar resultado: no tiene sentido seguir esperando
+            return cache.get(key)
+        time.sleep(0.2)
+    return None
+
+
+def _cached(kind, fn, query, site_id, limit, offset, refresh=False):
+    key = _cache_key(kind, query, site_id, limit, offset)
+    lock_name = key + ":lock"
+    error_key = key + ":error"
+    hit = None if refresh else cache.get(key)
+    deadline = time.time() + FETCH_WAIT_TIMEOUT
+    while hit is None:
+        # un solo fetch por host: el lease se renueva mientras dura y solo lo suelta su dueño
+        lease = Lease(lock_name, FETCH_LOCK_TTL)
+        if lease.acquire():
+            with lease:
+                cache.delete(error_key)
+                try:
+                    results, paging = fn(query, site_id=site_id, limit=limit, offset=offset)
+                except Exception as e:
+                    # marca corta para que los que esperaban fallen rápido en vez de repetir el fetch
+                    cache.set(error_key, str(e) or e.__class__.__name__, FETCH_ERROR_TTL)
+                    raise
+                ttl = SEARCH_CACHE_TTL if results else SEARCH_EMPTY_TTL
+                cache.set(key, {"results": results, "paging": paging, "expires_at": time.time() + ttl}, ttl)
+                return list(results), dict(paging)
+        hit = _wait_for_entry(key, lease.key, deadline)
+        if hit is None:
+            error = cache.get(error_key)
+            if error is not None:
+                raise RuntimeError(f"upstream fetch failed: {error}")
+            if time.time() >= deadline:
+                # nunca vamos directo a ML sin lock: eso multiplica los fetch por host
+                raise RuntimeError("upstream fetch still running in another worker")
+            # el dueño murió sin resultado ni error: intentamos tomar el lock nosotros
+    return list(hit["results"]), dict(hit["paging"])
+
+
+def cache_entry(kind, query, site_id, limit, offset):
+    """Entrada cacheada {results, paging, expires_at} o None si no hay."""
+    return cache.get(_cache_key(kind, query, site_id, limit, offset))
+
+
+def buscar_items_por_categoria_cached(query: str, site_id: str = "MLC", limit: int = 12, offset: int = 0, refresh: bool = False):
+    return _cached("categoria", buscar_items_por_categoria, query, site_id, limit, offset, refresh)
+
+
+def buscar_items_cached(query: str, site_id: str = DEFAULT_SITE, limit: int = 24, offset: int = 0, refresh: bool = False):
+    return _cached("search", buscar_items, query, site_id, limit, offset, refresh)
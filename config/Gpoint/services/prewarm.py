@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from . import mercadolibre as ml_service
+
+# Prewarm de las búsquedas más populares.
+# Las vistas registran cada query; un hilo en segundo plano vuelve a correr
+# las top N antes de que venza su cache, sin pasarse del presupuesto de llamadas a ML.
+
+ENABLED = getattr(settings, "ML_PREWARM_ENABLED", True)
+INTERVAL = getattr(settings, "ML_PREWARM_INTERVAL", 60)           # segundos entre rondas
+TOP_N = getattr(settings, "ML_PREWARM_TOP_N", 10)
+BUDGET = getattr(settings, "ML_PREWARM_BUDGET", 200)               # llamadas HTTP a ML por ronda, por proceso
+MARGIN = getattr(settings, "ML_PREWARM_MARGIN", INTERVAL * 2)      # refrescar si vence antes de esto
+DECAY = getattr(settings, "ML_PREWARM_DECAY", 0.9)                 # olvido por ronda
+# los productos del home: siempre quedan en el top
+SEEDS = getattr(settings, "ML_PREWARM_SEEDS", ["bombillas", "botella", "bolsa de tela", "cepillo"])
+
+# mismos parámetros que usan las vistas, para pegarle a la misma key de cache
+PRODUCTOS_LIMIT = 24
+SEARCH_LIMIT = 24
+
+# peor caso de llamadas HTTP por query, para no pasarnos del presupuesto
+# (el POST de refresh de token también cuenta, ver mercadolibre._do_refresh):
+# categoría = refresh + domain_discovery + highlights + 2 por producto, por sitio (MLC y MLA)
+PRODUCTOS_COST = 2 * (1 + 2 + 2 * PRODUCTOS_LIMIT)
+# ml_get = refresh + GET (401) + refresh + GET, en MLC y fallback MLA
+SEARCH_COST = 2 * 4
+
+_lock = threading.Lock()
+_thread = None
+_counts = Counter()
+_stats = {"rounds": 0, "refreshed": 0, "last_calls": 0, "last_run": None}
+
+
+def _normalize(query):
+    return " ".join((query or "").lower().split())
+
+
+def record_query(kind, query):
+    """Suma una ocurrencia de la query. kind: 'productos' o 'search'."""
+    q = _normalize(query)
+    if not q:
+        return
+    with _lock:
+        _counts[(kind, q)] += 1
+
+
+def top_queries(n=TOP_N):
+    with _lock:
+        counts = Counter(_counts)
+    seed_weight = max(counts.values(), default=1) + 1
+    for seed in SEEDS:
+        counts[("productos", _normalize(seed))] += seed_weight
+    return [key for key, _c in counts.most_common(n)]
+
+
+# ===================== REFRESCO =====================
+
+def _needs_refresh(kind, query, site_id, limit):
+    hit = ml_service.cache_entry(kind, query, site_id, limit, 0)
+    if hit is None:
+        return True
+    # los vacíos viven poco a propósito; no gastamos presupuesto en mantenerlos
+    return bool(hit["results"]) and hit["expires_at"] - time.time() < MARGIN
+
+
+def _warm_productos(q):
+    # misma cadena que views.productos: MLC y si viene vacío, MLA
+    refreshed = 0
+    if _needs_refresh("categoria", q, "MLC", PRODUCTOS_LIMIT):
+        ml_service.buscar_items_por_categoria_cached(q, site_id="MLC", limit=PRODUCTOS_LIMIT, refresh=True)
+        refreshed += 1
+    results, _paging = ml_service.buscar_items_por_categoria_cached(q, site_id="MLC", limit=PRODUCTOS_LIMIT)
+    if not results and _needs_refresh("categoria", q, "MLA", PRODUCTOS_LIMIT):
+        ml_service.buscar_items_por_categoria_cached(q, site_id="MLA", limit=PRODUCTOS_LIMIT, refresh=True)
+        refreshed += 1
+    return refreshed
+
+
+def _warm_search(q):
+    if not _needs_refresh("search", q, ml_service.DEFAULT_SITE, SEARCH_LIMIT):
+        return 0
+    ml_service.buscar_items_cached(q, limit=SEARCH_LIMIT, refresh=True)
+    return 1
+
+
+def run_round(top_n=TOP_N, budget=BUDGET):
+    """Refresca las top N queries que estén por vencer. Devuelve cuántas refrescó."""
+    start_calls = ml_service.upstream_calls()
+    refreshed = 0
+    for kind, q in top_queries(top_n):
+        cost = PRODUCTOS_COST if kind == "productos" else SEARCH_COST
+        if budget - (ml_service.upstream_calls() - start_calls) < cost:
+            # no alcanza para esta; quizás sí para una más barata
+            continue
+        try:
+            if kind == "productos":
+                refreshed += _warm_productos(q)
+            else:
+                refreshed += _warm_search(q)
+        except Exception:
+            continue
+    with _lock:
+        for key in list(_counts):
+            _counts[key] *= DECAY
+            if _counts[key] < 0.5:
+                del _counts[key]
+        _stats["rounds"] += 1
+        _stats["refreshed"] += refreshed
+        _stats["last_calls"] = ml_service.upstream_calls() - start_calls
+        _stats["last_run"] = time.time()
+    return refreshed
+
+
+def _loop():
+    while True:
+        run_round()
+        time.sleep(INTERVAL)
+
+
+def start_scheduler():
+    """Lanza el hilo de prewarm una sola vez por proceso (si está habilitado)."""
+    global _thread
+    if not ENABLED:
+        return
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_loop, name="ml-prewarm", daemon=True)
+        _thread.start()
+
+
+def stats():
+    with _lock:
+        return dict(_stats, tracked=len(_counts))
@@ -0,0 +1,253 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Backend de cache de Django compartido entre procesos (workers de gunicorn).
+# SQLite en modo WAL en disco local: lectores no bloquean al escritor y cada
+# operación es una sola sentencia atómica. Los valores van en pickle binario,
+# comprimidos con zlib si son grandes.
+#
+# CACHES = {"default": {
+#     "BACKEND": "Gpoint.services.shared_cache.SQLiteCache",
+#     "LOCATION": "/ruta/ml_cache.sqlite3",
+# }}
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+COMPRESS_MIN = 1024   # bytes desde los que vale la pena comprimir
+CULL_EVERY = 100      # cada cuántos set() revisamos MAX_ENTRIES
+# keys de coordinación (locks, cupos): el cull nunca las bota, ver Lease
+LEASE_PREFIX = "lease:"
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        self._local = threading.local()
+        self._sets = 0
+        self._lease_like = self.make_key(LEASE_PREFIX) + "%"
+
+    # ===================== CONEXIÓN =====================
+
+    def _conn(self):
+        # una conexión por hilo y por proceso (después de un fork se reabre)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL"
+            ") WITHOUT ROWID"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # ===================== SERIALIZACIÓN =====================
+
+    def _dumps(self, value):
+        raw = pickle.dumps(value, self.pickle_protocol)
+        if len(raw) >= COMPRESS_MIN:
+            return _ZLIB + zlib.compress(raw, 1)
+        return _RAW + raw
+
+    def _loads(self, blob):
+        blob = bytes(blob)
+        if blob[:1] == _ZLIB:
+            return pickle.loads(zlib.decompress(blob[1:]))
+        return pickle.loads(blob[1:])
+
+    # ===================== API =====================
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return default
+        return self._loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, self._dumps(value), self.get_backend_timeout(timeout)),
+        )
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # atómico: solo escribe si no existe o ya venció (sirve como lock entre procesos)
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._conn().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+            (key, self._dumps(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        return cur.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        # leer, sumar y escribir dentro de una transacción: atómico entre procesos
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._loads(row[0]) + delta
+            conn.execute("UPDATE cache SET value = ? WHERE key = ?", (self._dumps(value), key))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def touch_if_value(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """touch() solo si la key sigue teniendo ese valor (renovar un lease propio)."""
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._conn().execute(
+            "UPDATE cache SET expires = ? WHERE key = ? AND value = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, self._dumps(value), time.time()),
+        )
+        return cur.rowcount > 0
+
+    def delete_if_value(self, key, value, version=None):
+        """delete() solo si la key sigue teniendo ese valor (soltar un lease propio)."""
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._conn().execute(
+            "DELETE FROM cache WHERE key = ? AND value = ?", (key, self._dumps(value))
+        )
+        return cur.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._conn().execute(
+            "UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cur.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cur.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._conn().execute(
+            "SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Django llama close() al final de cada request; dejamos la conexión abierta
+        pass
+
+    # ===================== LIMPIEZA =====================
+
+    def _maybe_cull(self):
+        self._sets += 1
+        if self._sets % CULL_EVERY:
+            return
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        # los leases vivos no cuentan ni se botan: perderlos rompería locks y cupos
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM cache WHERE key NOT LIKE ?", (self._lease_like,)
+        ).fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            conn.execute("DELETE FROM cache WHERE key NOT LIKE ?", (self._lease_like,))
+            return
+        # borramos 1/cull_frequency, empezando por los que vencen antes
+        conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            " SELECT key FROM cache WHERE key NOT LIKE ?"
+            " ORDER BY expires IS NULL, expires LIMIT ?)",
+            (self._lease_like, count // self._cull_frequency),
+        )
+
+
+# ===================== LEASES =====================
+
+def lease_key(name):
+    return LEASE_PREFIX + name
+
+
+class Lease:
+    """
+    Lock con dueño sobre el cache de Django, válido entre procesos.
+    Se toma con add() y un token único, se renueva mientras se usa
+    (with lease: ...) y solo lo suelta quien lo tomó.
+    Con SQLiteCache renovar y soltar son atómicos; con otros backends
+    (LocMemCache en tests) se compara y luego se borra.
+    """
+
+    def __init__(self, name, ttl, cache=None):
+        self.key = lease_key(name)
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self._cache = cache or default_cache
+        self._stop = None
+
+    def acquire(self):
+        return self._cache.add(self.key, self.token, self.ttl)
+
+    def renew(self):
+        if hasattr(self._cache, "touch_if_value"):
+            return self._cache.touch_if_value(self.key, self.token, self.ttl)
+        if self._cache.get(self.key) != self.token:
+            return False
+        return self._cache.touch(self.key, self.ttl)
+
+    def release(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        if hasattr(self._cache, "delete_if_value"):
+            return self._cache.delete_if_value(self.key, self.token)
+        if self._cache.get(self.key) != self.token:
+            return False
+        return self._cache.delete(self.key)
+
+    def keep_alive(self):
+        """Renueva el lease cada ttl/3 en un hilo hasta release()."""
+        stop = self._stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.ttl / 3):
+                if not self.renew():
+                    return  # lo perdimos: no lo volvemos a tomar a ciegas
+
+        threading.Thread(target=beat, name=f"lease:{self.key}", daemon=True).start()
+
+    def __enter__(self):
+        self.keep_alive()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,140 @@
+import threading
+
+from django.conf import settings
+
+# Autocompletado para la barra de búsqueda.
+# Trie comprimido (radix) en memoria: cada nodo guarda su top K de términos,
+# así una consulta es solo bajar por el prefijo, sin recorrer el subárbol.
+
+TOP_K = getattr(settings, "ML_SUGGEST_TOP_K", 10)
+# tope de términos por proceso; al pasarlo se bota el 10% con menor score
+MAX_TERMS = getattr(settings, "ML_SUGGEST_MAX_TERMS", 5000)
+SEEDS = getattr(settings, "ML_PREWARM_SEEDS", ["bombillas", "botella", "bolsa de tela", "cepillo"])
+
+# pesos por fuente
+WEIGHT_QUERY = 3      # búsqueda que devolvió productos
+WEIGHT_CATEGORY = 2   # categoría descubierta por domain_discovery
+WEIGHT_TITLE = 1      # título de un producto verificado
+
+
+class _Node:
+    __slots__ = ("label", "children", "top")
+
+    def __init__(self, label=""):
+        self.label = label
+        self.children = {}   # primer caracter del label -> _Node
+        self.top = []        # keys ordenadas por score, máximo TOP_K
+
+
+_lock = threading.Lock()
+_root = _Node()
+_scores = {}     # key normalizada -> score acumulado
+_display = {}    # key normalizada -> texto a mostrar
+
+
+def _normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def _bump(node, key):
+    # los scores solo suben, así que basta con reubicar la key en este nodo
+    if key in node.top:
+        node.top.remove(key)
+    node.top.append(key)
+    node.top.sort(key=lambda k: -_scores[k])
+    del node.top[TOP_K:]
+
+
+def _common_len(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _insert(root, key):
+    node = root
+    rest = key
+    _bump(node, key)
+    while rest:
+        child = node.children.get(rest[0])
+        if child is None:
+            child = _Node(rest)
+            node.children[rest[0]] = child
+            _bump(child, key)
+            return
+        n = _common_len(child.label, rest)
+        if n < len(child.label):
+            # partir el eje: mid hereda el top del hijo
+            mid = _Node(child.label[:n])
+            mid.top = list(child.top)
+            child.label = child.label[n:]
+            mid.children[child.label[0]] = child
+            node.children[rest[0]] = mid
+            child = mid
+        _bump(child, key)
+        node = child
+        rest = rest[n:]
+
+
+def _evict():
+    # sacar del trie obliga a recalcular los top de cada nodo: reconstruimos
+    global _root
+    seeds = {_normalize(seed) for seed in SEEDS}
+    keep = int(MAX_TERMS * 0.9)
+    ranked = sorted(_scores, key=lambda k: (k not in seeds, -_scores[k]))
+    for key in ranked[keep:]:
+        del _scores[key]
+        del _display[key]
+    _root = _Node()
+    for key in _scores:
+        _insert(_root, key)
+
+
+def add(text, weight=1):
+    """Agrega (o refuerza) un término. Es incremental salvo cuando toca botar términos."""
+    key = _normalize(text)
+    if not key:
+        return
+    with _lock:
+        _scores[key] = _scores.get(key, 0) + weight
+        _display.setdefault(key, " ".join(text.split()))
+        if len(_scores) > MAX_TERMS:
+            _evict()
+        else:
+            _insert(_root, key)
+
+
+def add_many(texts, weight=1):
+    for text in texts:
+        add(text, weight)
+
+
+def suggest(prefix, limit=8):
+    """Completions rankeadas para el prefijo: [(texto, score), ...], a lo más TOP_K."""
+    rest = _normalize(prefix)
+    if not rest:
+        return []
+    with _lock:
+        node = _root
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                return []
+            if rest.startswith(child.label):
+                rest = rest[len(child.label):]
+            elif child.label.startswith(rest):
+                rest = ""
+            else:
+                return []
+            node = child
+        return [(_display[k], _scores[k]) for k in node.top[:limit]]
+
+
+def size():
+    with _lock:
+        return len(_scores)
+
+
+add_many(SEEDS, WEIGHT_QUERY)
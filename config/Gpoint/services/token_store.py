@@ -1,5 +1,6 @@
 from pathlib import Path
 import json
+import os
 import threading
 import time
 
@@ -7,8 +8,15 @@ import time
 # Queda en la raíz del proyecto.
 
 from django.conf import settings
+from django.core.cache import cache
+from .shared_cache import Lease, lease_key
 TOKEN_FILE = settings.BASE_DIR.parent / "ml_tokens.json"
 
+# El access_token vive también en el cache compartido (ver shared_cache.py),
+# así todos los workers lo leen de ahí sin releer el json en cada request.
+ACCESS_TOKEN_KEY = "ml:access_token"
+REFRESH_LOCK_KEY = "ml:refresh_lock"
+
 _lock = threading.Lock()
 
 def load_tokens():
@@ -34,17 +42,46 @@ def save_tokens(access_token: str, refresh_token: str | None, expires_in: int):
             payload["refresh_token"] = refresh_token
         # margen de 60s para refrescar antes
         payload["expires_at"] = now + int(expires_in) - 60
-        TOKEN_FILE.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        # escribir y renombrar: otro worker nunca lee un json a medias
+        tmp = TOKEN_FILE.with_name(f"{TOKEN_FILE.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, TOKEN_FILE)
+        cache.set(ACCESS_TOKEN_KEY, access_token, max(int(payload["expires_at"] - now), 1))
 
 def get_persisted_refresh_token():
     return load_tokens().get("refresh_token")
 
 def get_cached_access_token():
+    token = cache.get(ACCESS_TOKEN_KEY)
+    if token:
+        return token
+    # cache vacío (arranque): caemos al json y lo subimos al cache
     data = load_tokens()
-    if data.get("access_token") and time.time() < data.get("expires_at", 0):
+    remaining = data.get("expires_at", 0) - time.time()
+    if data.get("access_token") and remaining > 0:
+        cache.set(ACCESS_TOKEN_KEY, data["access_token"], max(int(remaining), 1))
         return data["access_token"]
     return None
 
+# Lock entre procesos para que un solo worker por host haga el refresh.
+# Devuelve el Lease tomado (usar con `with`, se renueva y solo lo suelta su dueño) o None.
+def acquire_refresh_lock(timeout: int = 30):
+    lease = Lease(REFRESH_LOCK_KEY, timeout)
+    return lease if lease.acquire() else None
+
+#espera a que otro worker deje un access_token distinto al que teníamos
+def wait_for_access_token(previous: str | None, timeout: float = 15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        token = cache.get(ACCESS_TOKEN_KEY)
+        if token and token != previous:
+            return token
+        if cache.get(lease_key(REFRESH_LOCK_KEY)) is None:
+            # el otro worker soltó el lock sin dejar token nuevo (falló)
+            return None
+        time.sleep(0.2)
+    return None
+
 #actualiza solo el access_token (sin tocar refresh)
 def cache_access_token(access_token: str, expires_in: int):
 
@@ -0,0 +1,22 @@
+// Autocompletado de la barra de búsqueda usando /api/suggest/
+document.querySelectorAll("input[data-suggest]").forEach(function (input) {
+  var lista = document.getElementById(input.getAttribute("list"));
+  var ultimo = "";
+  input.addEventListener("input", function () {
+    var q = input.value.trim();
+    if (!q || q === ultimo) return;
+    ultimo = q;
+    fetch("/api/suggest/?q=" + encodeURIComponent(q))
+      .then(function (r) { return r.json(); })
+      .then(function (data) {
+        if (q !== ultimo) return;  // ya escribió otra cosa
+        lista.innerHTML = "";
+        data.suggestions.forEach(function (s) {
+          var op = document.createElement("option");
+          op.value = s.text;
+          lista.appendChild(op);
+        });
+      })
+      .catch(function () {});
+  });
+});
@@ -1,3 +1,507 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import middleware as admission
+from . import views
+from .services import health as health_service
+from .services import mercadolibre as ml_service
+from .services import prewarm as prewarm_service
+from .services import shared_cache
+from .services import suggest as suggest_service
+
+
+class HealthProberTests(SimpleTestCase):
+    def setUp(self):
+        for samples in health_service._samples.values():
+            samples.clear()
+        health_service._state.update(last_run=None, user_id=None, site_id=None, canary_results=None)
+        health_service._state["last_error"] = {name: None for name in health_service.CHECKS}
+        patches = [
+            mock.patch.object(health_service.ml_service, "_get_access_token", return_value="tok"),
+            mock.patch.object(health_service.ml_service, "get_me", return_value={"id": 7, "site_id": "MLC"}),
+            mock.patch.object(
+                health_service.ml_service, "buscar_items_por_categoria",
+                return_value=([{"title": "botella"}], {}),
+            ),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_stats_over_window(self):
+        stats = health_service._stats([(True, 10.0), (False, 30.0), (True, 20.0), (True, 40.0)])
+        self.assertEqual(stats["samples"], 4)
+        self.assertTrue(stats["ok"])  # la última muestra
+        self.assertEqual(stats["error_rate"], 0.25)
+        self.assertEqual(stats["p50_ms"], 30.0)
+        self.assertEqual(stats["p95_ms"], 40.0)
+
+    def test_healthy_probe(self):
+        health_service.run_probe()
+        snap = health_service.snapshot()
+        self.assertTrue(snap["ok"])
+        self.assertEqual(snap["status"], "ok")
+        self.assertEqual(snap["user_id"], 7)
+        self.assertEqual(snap["checks"]["canary_search"]["error_rate"], 0.0)
+
+    def test_empty_canary_is_a_failure(self):
+        health_service.ml_service.buscar_items_por_categoria.return_value = ([], {})
+        health_service.run_probe()
+        snap = health_service.snapshot()
+        self.assertFalse(snap["ok"])
+        self.assertEqual(snap["status"], "failing")
+        self.assertFalse(snap["checks"]["canary_search"]["ok"])
+        self.assertIn("no results", snap["checks"]["canary_search"]["last_error"])
+
+    def test_token_failure_skips_other_checks(self):
+        health_service.ml_service._get_access_token.side_effect = RuntimeError("401")
+        health_service.run_probe()
+        snap = health_service.snapshot()
+        self.assertFalse(snap["ok"])
+        self.assertEqual(snap["checks"]["users_me"]["samples"], 0)
+        health_service.ml_service.get_me.assert_not_called()
+
+    def test_old_snapshot_is_stale(self):
+        health_service.run_probe()
+        health_service._state["last_run"] = time.time() - health_service.STALE_AFTER - 1
+        snap = health_service.snapshot()
+        self.assertTrue(snap["stale"])
+        self.assertFalse(snap["ok"])
+        self.assertEqual(snap["status"], "stale")
+
+    def test_health_reports_starting_before_first_round(self):
+        request = RequestFactory().get("/ml/health/")
+        with mock.patch.object(health_service, "start_prober"), \
+                mock.patch.object(health_service, "is_alive", return_value=True):
+            response = views.ml_health(request)
+            ready = views.ml_health_ready(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"starting"', response.content)
+        self.assertEqual(ready.status_code, 503)
+
+
+class PrewarmTests(SimpleTestCase):
+    def setUp(self):
+        prewarm_service._counts.clear()
+        self.calls = 0
+        self.entries = {}
+        self.warmed = []
+
+        def cached(kind, cost, results):
+            def fn(query, site_id=ml_service.DEFAULT_SITE, limit=24, offset=0, refresh=False):
+                if refresh or (kind, query, site_id) not in self.entries:
+                    self.calls += cost  # peor caso, como lo cuenta upstream_calls()
+                    self.warmed.append((kind, query, site_id))
+                    self.entries[(kind, query, site_id)] = {
+                        "results": results, "paging": {}, "expires_at": time.time() + 600,
+                    }
+                return list(self.entries[(kind, query, site_id)]["results"]), {}
+            return fn
+
+        def cache_entry(kind, query, site_id, limit, offset):
+            return self.entries.get((kind, query, site_id))
+
+        fake = mock.Mock(
+            DEFAULT_SITE="MLC",
+            upstream_calls=lambda: self.calls,
+            cache_entry=cache_entry,
+            buscar_items_por_categoria_cached=cached("categoria", prewarm_service.PRODUCTOS_COST // 2, [{"title": "x"}]),
+            buscar_items_cached=cached("search", prewarm_service.SEARCH_COST, [{"title": "x"}]),
+        )
+        patcher = mock.patch.object(prewarm_service, "ml_service", fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_top_queries_puts_seeds_first_then_by_frequency(self):
+        for _ in range(3):
+            prewarm_service.record_query("search", "Mouse ")
+        prewarm_service.record_query("productos", "guatero")
+        top = prewarm_service.top_queries(10)
+        seeds = [("productos", seed) for seed in prewarm_service.SEEDS]
+        self.assertEqual(top[:len(seeds)], seeds)
+        self.assertEqual(top[len(seeds):], [("search", "mouse"), ("productos", "guatero")])
+        self.assertEqual(len(prewarm_service.top_queries(2)), 2)
+
+    def test_needs_refresh(self):
+        now = time.time()
+        self.entries[("categoria", "fresco", "MLC")] = {"results": [1], "expires_at": now + 600}
+        self.entries[("categoria", "por vencer", "MLC")] = {"results": [1], "expires_at": now + 1}
+        self.entries[("categoria", "vacio", "MLC")] = {"results": [], "expires_at": now + 1}
+        self.assertTrue(prewarm_service._needs_refresh("categoria", "nuevo", "MLC", 24))
+        self.assertTrue(prewarm_service._needs_refresh("categoria", "por vencer", "MLC", 24))
+        self.assertFalse(prewarm_service._needs_refresh("categoria", "fresco", "MLC", 24))
+        self.assertFalse(prewarm_service._needs_refresh("categoria", "vacio", "MLC", 24))
+
+    def test_run_round_never_exceeds_budget(self):
+        prewarm_service.record_query("search", "mouse")
+        # alcanza para 1 productos (MLC) + la búsqueda barata, no para 2 productos
+        budget = prewarm_service.PRODUCTOS_COST + prewarm_service.SEARCH_COST
+        refreshed = prewarm_service.run_round(top_n=10, budget=budget)
+        self.assertLessEqual(self.calls, budget)
+        self.assertEqual(refreshed, 2)
+        self.assertIn(("search", "mouse", "MLC"), self.warmed)
+        self.assertEqual(prewarm_service.stats()["last_calls"], self.calls)
+
+    def test_run_round_skips_fresh_entries(self):
+        prewarm_service.run_round(top_n=4, budget=10_000)
+        calls = self.calls
+        self.assertEqual(prewarm_service.run_round(top_n=4, budget=10_000), 0)
+        self.assertEqual(self.calls, calls)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = self._make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _make_cache(self, **options):
+        path = Path(self.tmpdir) / "cache.sqlite3"
+        return shared_cache.SQLiteCache(path, {"TIMEOUT": 300, "OPTIONS": options})
+
+    def _expires(self, key):
+        key = self.cache.make_key(key)
+        row = self.cache._conn().execute("SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    def test_add_missing_key(self):
+        self.assertTrue(self.cache.add("lock", 1))
+        self.assertEqual(self.cache.get("lock"), 1)
+
+    def test_add_live_key_fails(self):
+        self.cache.set("lock", 1)
+        self.assertFalse(self.cache.add("lock", 2))
+        self.assertEqual(self.cache.get("lock"), 1)
+
+    def test_add_expired_key_takes_over(self):
+        self.cache.set("lock", 1, 0)  # timeout 0 = ya vencido
+        self.assertTrue(self.cache.add("lock", 2, 30))
+        self.assertEqual(self.cache.get("lock"), 2)
+
+    def test_add_without_expiry_is_never_replaced(self):
+        self.cache.set("lock", 1, None)
+        self.assertFalse(self.cache.add("lock", 2))
+
+    def test_add_is_shared_between_instances(self):
+        # otra instancia sobre el mismo archivo hace de "otro worker"
+        other = self._make_cache()
+        self.assertTrue(self.cache.add("lock", 1))
+        self.assertFalse(other.add("lock", 2))
+        self.cache.delete("lock")
+        self.assertTrue(other.add("lock", 2))
+
+    def test_get_respects_ttl(self):
+        self.cache.set("k", "v", 0.2)
+        self.assertEqual(self.cache.get("k"), "v")
+        self.assertTrue(self.cache.has_key("k"))
+        time.sleep(0.3)
+        self.assertIsNone(self.cache.get("k"))
+        self.assertEqual(self.cache.get("k", "default"), "default")
+        self.assertFalse(self.cache.has_key("k"))
+
+    def test_large_values_are_compressed(self):
+        value = {"results": [{"title": f"botella reutilizable {i}"} for i in range(200)]}
+        self.cache.set("big", value)
+        blob = self.cache._conn().execute(
+            "SELECT value FROM cache WHERE key = ?", (self.cache.make_key("big"),)
+        ).fetchone()[0]
+        self.assertEqual(bytes(blob)[:1], shared_cache._ZLIB)
+        self.assertEqual(self.cache.get("big"), value)
+
+    def test_small_values_are_not_compressed(self):
+        self.cache.set("small", "x")
+        blob = self.cache._conn().execute(
+            "SELECT value FROM cache WHERE key = ?", (self.cache.make_key("small"),)
+        ).fetchone()[0]
+        self.assertEqual(bytes(blob)[:1], shared_cache._RAW)
+        self.assertEqual(self.cache.get("small"), "x")
+
+    def test_incr_is_atomic_between_instances(self):
+        other = self._make_cache()
+        self.cache.set("n", 0, None)
+
+        def bump(c):
+            for _ in range(50):
+                c.incr("n")
+
+        threads = [threading.Thread(target=bump, args=(c,)) for c in (self.cache, other)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.cache.get("n"), 100)
+
+    def test_cull_drops_expired_then_soonest_to_expire(self):
+        self.cache = self._make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        with mock.patch.object(shared_cache, "CULL_EVERY", 1):
+            for i in range(11):
+                self.cache.set(f"k{i:02d}", i, 100 + i)
+        # 11 > 10: se borran 11 // 2 = 5, los que vencen antes
+        for i in range(5):
+            self.assertIsNone(self._expires(f"k{i:02d}"))
+        for i in range(5, 11):
+            self.assertEqual(self.cache.get(f"k{i:02d}"), i)
+
+        with mock.patch.object(shared_cache, "CULL_EVERY", 1):
+            self.cache.set("old", 1, 0)
+            self.cache.set("new", 2)
+        self.assertIsNone(self._expires("old"))
+
+    def test_cull_never_drops_live_leases(self):
+        self.cache = self._make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        # los leases vencen antes que todo lo demás: serían los primeros en irse
+        slot = shared_cache.Lease("admission:productos:slot:0", 5, cache=self.cache)
+        lock = shared_cache.Lease("ml:categoria:MLC:24:0:botella:lock", 5, cache=self.cache)
+        self.assertTrue(slot.acquire())
+        self.assertTrue(lock.acquire())
+        with mock.patch.object(shared_cache, "CULL_EVERY", 1):
+            for i in range(30):
+                self.cache.set(f"k{i:02d}", i, 100 + i)
+        self.assertTrue(self.cache.has_key(slot.key))
+        self.assertTrue(self.cache.has_key(lock.key))
+        self.assertFalse(shared_cache.Lease("admission:productos:slot:0", 5, cache=self.cache).acquire())
+
+        with mock.patch.object(shared_cache, "CULL_EVERY", 1), \
+                mock.patch.object(self.cache, "_cull_frequency", 0):
+            self.cache.set("k99", 99)
+        self.assertTrue(self.cache.has_key(slot.key))
+
+    def test_lease_is_released_only_by_its_owner(self):
+        first = shared_cache.Lease("lock", 30, cache=self.cache)
+        second = shared_cache.Lease("lock", 30, cache=self.cache)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertFalse(second.release())
+        self.assertFalse(second.renew())
+        self.assertTrue(self.cache.has_key(first.key))
+        self.assertTrue(first.release())
+        self.assertTrue(second.acquire())
+
+    def test_expired_lease_cannot_free_the_new_owner(self):
+        first = shared_cache.Lease("lock", 0.1, cache=self.cache)
+        self.assertTrue(first.acquire())
+        time.sleep(0.2)
+        second = shared_cache.Lease("lock", 30, cache=self.cache)
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.release())
+        self.assertTrue(self.cache.has_key(second.key))
+
+    def test_keep_alive_renews_past_ttl(self):
+        lease = shared_cache.Lease("lock", 0.3, cache=self.cache)
+        self.assertTrue(lease.acquire())
+        with lease:
+            time.sleep(0.8)
+            self.assertTrue(self.cache.has_key(lease.key))
+        self.assertFalse(self.cache.has_key(lease.key))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CachedSearchTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_waiters_fail_fast_when_lock_holder_fails(self):
+        calls = []
+
+        def failing(query, site_id, limit, offset):
+            calls.append(query)
+            time.sleep(0.3)
+            raise ValueError("highlights 403")
+
+        errors = []
+
+        def search():
+            started = time.monotonic()
+            try:
+                ml_service._cached("categoria", failing, "botella", "MLC", 24, 0)
+            except Exception as e:
+                errors.append((time.monotonic() - started, str(e)))
+
+        threads = [threading.Thread(target=search) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(elapsed < 2 for elapsed, _msg in errors))
+
+    def test_slow_fetch_keeps_its_lock(self):
+        calls = []
+
+        def slow(query, site_id, limit, offset):
+            calls.append(query)
+            time.sleep(0.8)  # más que el lease: tiene que renovarse
+            return [{"title": query}], {}
+
+        results = []
+
+        def search():
+            results.append(ml_service._cached("categoria", slow, "botella", "MLC", 24, 0)[0])
+
+        with mock.patch.object(ml_service, "FETCH_LOCK_TTL", 0.3):
+            threads = [threading.Thread(target=search) for _ in range(3)]
+            for t in threads:
+                t.start()
+                time.sleep(0.1)
+            for t in threads:
+                t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [[{"title": "botella"}]] * 3)
+
+    def test_waiter_timeout_raises_instead_of_fetching(self):
+        holder = shared_cache.Lease("ml:categoria:MLC:24:0:botella:lock", 30)
+        self.assertTrue(holder.acquire())
+        fn = mock.Mock(return_value=([], {}))
+        try:
+            with mock.patch.object(ml_service, "FETCH_WAIT_TIMEOUT", 0.3):
+                with self.assertRaisesMessage(RuntimeError, "still running"):
+                    ml_service._cached("categoria", fn, "botella", "MLC", 24, 0)
+        finally:
+            holder.release()
+        fn.assert_not_called()
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class AdmissionControlTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def test_sheds_when_slots_and_queue_are_full(self):
+        limiter = admission._Limiter("test", max_concurrent=1, max_queue=0, max_wait=0.1)
+        slot = limiter.acquire()
+        self.assertIsNotNone(slot)
+        self.assertIsNone(limiter.acquire())
+        self.assertEqual(limiter.stats()["in_flight"], 1)
+        self.assertEqual(limiter.stats()["shed"], 1)
+        limiter.release(slot)
+        self.assertIsNotNone(limiter.acquire())
+
+    def test_queued_request_gets_freed_slot(self):
+        limiter = admission._Limiter("test", max_concurrent=1, max_queue=1, max_wait=2.0)
+        slot = limiter.acquire()
+        threading.Timer(0.2, limiter.release, args=(slot,)).start()
+        self.assertIsNotNone(limiter.acquire())
+        self.assertEqual(limiter.stats()["admitted"], 2)
+        self.assertEqual(limiter.stats()["queue_depth"], 0)
+
+    def test_late_release_does_not_free_another_requests_slot(self):
+        limiter = admission._Limiter("test", max_concurrent=1, max_queue=0, max_wait=0.1)
+        with mock.patch.object(admission, "SLOT_TTL", 0.1):
+            first = limiter.acquire()
+            time.sleep(0.2)  # el cupo del primero venció sin renovarse
+            second = limiter.acquire()
+        self.assertIsNotNone(second)
+        limiter.release(first)
+        self.assertEqual(limiter.stats()["in_flight"], 1)
+        self.assertIsNone(limiter.acquire())
+        limiter.release(second)
+
+    def test_long_request_keeps_its_slot(self):
+        limiter = admission._limiters["productos"]
+
+        def slow_view(request):
+            time.sleep(0.5)
+            return HttpResponse("ok")
+
+        mw = admission.AdmissionControlMiddleware(slow_view)
+        with mock.patch.object(admission, "SLOT_TTL", 0.15):
+            worker = threading.Thread(target=mw, args=(self.factory.get("/search/productos/"),))
+            worker.start()
+            time.sleep(0.35)  # ya pasó más de un SLOT_TTL
+            self.assertEqual(limiter.stats()["in_flight"], 1)
+            worker.join()
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_shed_returns_503_with_retry_after(self):
+        limiter = admission._limiters["productos"]
+        slots = [limiter.acquire() for _ in range(limiter.max_concurrent)]
+        with mock.patch.object(limiter, "max_wait", 0.1):
+            mw = admission.AdmissionControlMiddleware(lambda request: HttpResponse("ok"))
+            response = mw(self.factory.get("/search/productos/", {"busqueda": "botella"}))
+        for slot in slots:
+            limiter.release(slot)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], str(admission.RETRY_AFTER))
+
+    def test_stale_copy_only_for_marked_responses(self):
+        def view(request):
+            response = HttpResponse(request.GET["busqueda"])
+            response.admission_stale_ok = request.GET["busqueda"] == "botella"
+            return response
+
+        mw = admission.AdmissionControlMiddleware(view)
+        good = self.factory.get("/search/productos/", {"busqueda": "botella"})
+        failed = self.factory.get("/search/productos/", {"busqueda": "falla"})
+        mw(good)
+        mw(failed)
+        self.assertIsNotNone(cache.get(admission._stale_key(good)))
+        self.assertIsNone(cache.get(admission._stale_key(failed)))
+
+    def test_unlimited_views_pass_through(self):
+        mw = admission.AdmissionControlMiddleware(lambda request: HttpResponse("home"))
+        with mock.patch.object(admission._Limiter, "acquire") as acquire:
+            response = mw(self.factory.get("/"))
+        self.assertEqual(response.status_code, 200)
+        acquire.assert_not_called()
+
+
+class SuggestTrieTests(SimpleTestCase):
+    def setUp(self):
+        suggest_service._root = suggest_service._Node()
+        suggest_service._scores.clear()
+        suggest_service._display.clear()
+
+    def test_top_k_after_edge_splits(self):
+        # "bolsa de tela" entra primero y los demás van partiendo su eje
+        suggest_service.add("bolsa de tela", 2)
+        suggest_service.add("bolsa", 5)
+        suggest_service.add("bolsa de papel", 3)
+        suggest_service.add("botella", 4)
+        suggest_service.add("bo", 1)
+
+        self.assertEqual(
+            suggest_service.suggest("bo", 10),
+            [("bolsa", 5), ("botella", 4), ("bolsa de papel", 3), ("bolsa de tela", 2), ("bo", 1)],
+        )
+        # prefijo que termina a mitad de un eje
+        self.assertEqual(
+            suggest_service.suggest("bolsa d", 10),
+            [("bolsa de papel", 3), ("bolsa de tela", 2)],
+        )
+        self.assertEqual(suggest_service.suggest("bot", 10), [("botella", 4)])
+        self.assertEqual(suggest_service.suggest("bx", 10), [])
+
+    def test_top_k_is_capped_and_reranked(self):
+        for i in range(suggest_service.TOP_K + 5):
+            suggest_service.add(f"cepillo {i:02d}", 1)
+        suggest_service.add("cepillo 14", 10)
+
+        got = suggest_service.suggest("cep", 50)
+        self.assertEqual(len(got), suggest_service.TOP_K)
+        self.assertEqual(got[0], ("cepillo 14", 11))
+
+    def test_evicts_lowest_scores_over_max_terms(self):
+        max_terms = suggest_service.MAX_TERMS
+        suggest_service.MAX_TERMS = 20
+        try:
+            suggest_service.add("botella", 100)
+            for i in range(25):
+                suggest_service.add(f"titulo {i:02d}", 1)
+            self.assertLessEqual(suggest_service.size(), 20)
+            self.assertEqual(suggest_service.suggest("bot", 5), [("botella", 100)])
+        finally:
+            suggest_service.MAX_TERMS = max_terms
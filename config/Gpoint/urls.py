@@ -6,6 +6,10 @@ urlpatterns = [
     path('search/', views.search, name='search'),
     path('search/productos/', views.productos, name='productos'),
     path("ml/health/", views.ml_health, name="ml_health"),
+    path("ml/health/live/", views.ml_health_live, name="ml_health_live"),
+    path("ml/health/ready/", views.ml_health_ready, name="ml_health_ready"),
+    path("ml/admission/", views.admission_stats, name="admission_stats"),
     path("api/ml/search/", views.ml_search_api, name="ml_search_api"),
+    path("api/suggest/", views.suggest_api, name="suggest_api"),
     path('eco-tips/', views.eco_tips, name='eco_tips')
 ]
@@ -1,6 +1,10 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponseServerError
+from django.http import JsonResponse
 from .services import mercadolibre as ml_service
+from .services import health as health_service
+from .services import prewarm as prewarm_service
+from .services import suggest as suggest_service
+from . import middleware as admission
 
 def home(request):
     return render(request, 'home.html')
@@ -16,15 +20,25 @@ def productos(request):
     paging = {"total": 0, "limit": limit, "offset": offset}
     error = None
 
+    prewarm_service.start_scheduler()
+    prewarm_service.record_query("productos", q)
+
     try:
-        # 1) Chile (MLC) usando la ruta que evita 403
-        results, paging = ml_service.buscar_items_por_categoria(q, site_id="MLC", limit=limit, offset=offset)
+        # 1) Chile (MLC) usando la ruta que evita 403 (cacheada, ver prewarm)
+        results, paging = ml_service.buscar_items_por_categoria_cached(q, site_id="MLC", limit=limit, offset=offset)
 
         # 2) Si vino vacío, Fallback a Argentina (MLA) para mostrar algo
         if not results:
-            results, paging = ml_service.buscar_items_por_categoria(q, site_id="MLA", limit=limit, offset=offset)
+            results, paging = ml_service.buscar_items_por_categoria_cached(q, site_id="MLA", limit=limit, offset=offset)
             paging["fallback"] = True
 
+        # 2b) alimentar el autocompletado con lo que sí sirvió
+        if results:
+            suggest_service.add(q, suggest_service.WEIGHT_QUERY)
+            if paging.get("category_name"):
+                suggest_service.add(paging["category_name"], suggest_service.WEIGHT_CATEGORY)
+            suggest_service.add_many([item.get("title") for item in results], suggest_service.WEIGHT_TITLE)
+
         # 3) Mapear al template
         for item in results:
             thumb = (item.get("secure_thumbnail") or item.get("thumbnail") or "").replace("http://", "https://")
@@ -38,23 +52,50 @@ def productos(request):
     except Exception as e:
         error = str(e)
 
-    return render(request, "search.html", {
+    response = render(request, "search.html", {
         "productos": productos,
         "query": q,
         "paging": paging,
         "error": error
     })
+    # el middleware de admisión solo guarda como stale una búsqueda que sí trajo productos
+    response.admission_stale_ok = not error and bool(productos)
+    return response
 
 def ml_health(request):
     """
-    GET /ml/health/ -> { ok: true, user_id, site_id }
-    Comprueba que el token es válido y que podemos consultar /users/me.
+    GET /ml/health/ -> { ok, status, user_id, site_id, checks: {...} }
+    Responde desde memoria con lo último que midió el prober en segundo plano
+    (token, /users/me y una búsqueda canario). No llama a MercadoLibre.
+    Antes de la primera ronda responde 200 con status "starting".
     """
-    try:
-        me = ml_service.get_me()
-        return JsonResponse({"ok": True, "user_id": me.get("id"), "site_id": me.get("site_id")})
-    except Exception as e:
-        return HttpResponseServerError(f"ML health failed: {e}")
+    health_service.start_prober()
+    snap = health_service.snapshot()
+    return JsonResponse(snap, status=200 if snap["ok"] or snap["status"] == "starting" else 503)
+
+def ml_health_live(request):
+    """
+    GET /ml/health/live/ -> 200 mientras el proceso responda.
+    """
+    health_service.start_prober()
+    return JsonResponse({"ok": True, "prober_alive": health_service.is_alive()})
+
+def ml_health_ready(request):
+    """
+    GET /ml/health/ready/ -> 200 si la última ronda del prober fue OK y reciente, 503 si no.
+    """
+    health_service.start_prober()
+    snap = health_service.snapshot()
+    return JsonResponse(
+        {"ok": snap["ok"], "stale": snap["stale"], "age_s": snap["age_s"]},
+        status=200 if snap["ok"] else 503,
+    )
+
+def admission_stats(request):
+    """
+    GET /ml/admission/ -> cola, en vuelo y descartes por vista limitada (todo el host, compartido entre workers).
+    """
+    return JsonResponse({"ok": True, "views": admission.stats()})
 
 def ml_search_api(request):
     """
@@ -63,12 +104,31 @@ def ml_search_api(request):
     """
     q = request.GET.get("q", "").strip() or "mouse"
     offset = int(request.GET.get("offset", 0) or 0)
+    prewarm_service.start_scheduler()
+    prewarm_service.record_query("search", q)
     try:
-        results, paging = ml_service.buscar_items(q, limit=24, offset=offset)
-        return JsonResponse({"ok": True, "q": q, "paging": paging, "results": results})
+        results, paging = ml_service.buscar_items_cached(q, limit=24, offset=offset)
+        if results:
+            suggest_service.add(q, suggest_service.WEIGHT_QUERY)
+        response = JsonResponse({"ok": True, "q": q, "paging": paging, "results": results})
+        response.admission_stale_ok = bool(results)
+        return response
     except Exception as e:
         return JsonResponse({"ok": False, "error": str(e)}, status=500)
     
+def suggest_api(request):
+    """
+    GET /api/suggest/?q=bol&limit=8
+    Autocompletado desde memoria (queries exitosas, categorías y títulos). No llama a ML.
+    """
+    q = request.GET.get("q", "")
+    try:
+        limit = min(max(int(request.GET.get("limit") or 8), 1), suggest_service.TOP_K)
+    except ValueError:
+        limit = 8
+    suggestions = [{"text": text, "score": score} for text, score in suggest_service.suggest(q, limit)]
+    return JsonResponse({"ok": True, "q": q, "suggestions": suggestions})
+
 def eco_tips(request):
     consejos = [
         {
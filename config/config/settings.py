@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Gpoint.middleware.AdmissionControlMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -128,3 +129,32 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# MercadoLibre: health prober en segundo plano (ver Gpoint/services/health.py)
+ML_HEALTH_INTERVAL = 30          # segundos entre rondas de checks
+ML_HEALTH_AUTOSTART = True       # lanzar el prober al iniciar el servidor (no en check/migrate/test)
+ML_HEALTH_CANARY_QUERY = "botella"
+
+# MercadoLibre: cache de búsquedas y prewarm de las más populares (ver Gpoint/services/prewarm.py)
+ML_SEARCH_CACHE_TTL = 600        # segundos que vive un resultado en cache
+ML_PREWARM_ENABLED = True
+ML_PREWARM_TOP_N = 10
+ML_PREWARM_BUDGET = 200          # llamadas HTTP a ML por ronda, por proceso (cada worker tiene su scheduler)
+ML_PREWARM_SEEDS = ["bombillas", "botella", "bolsa de tela", "cepillo"]
+
+# Cache compartido entre workers (tokens y búsquedas), SQLite WAL en disco local
+CACHES = {
+    "default": {
+        "BACKEND": "Gpoint.services.shared_cache.SQLiteCache",
+        "LOCATION": BASE_DIR.parent / "ml_cache.sqlite3",
+        "TIMEOUT": 600,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+
+# Control de admisión para vistas que llaman a ML (ver Gpoint/middleware.py), por nombre de url.
+# Los límites son por host (cupos en el cache compartido), no por worker.
+ML_ADMISSION_LIMITS = {
+    "productos": {"max_concurrent": 4, "max_queue": 8, "max_wait": 2.0},
+    "ml_search_api": {"max_concurrent": 4, "max_queue": 8, "max_wait": 2.0},
+}
+ML_ADMISSION_RETRY_AFTER = 5